@@ -1,26 +1,152 @@
 import os
+import re
 import sys
-import csv
 import json
-import uuid
+import secrets
+import itertools
 import logging
+import queue
+import random
+import threading
+import time
+import openpyxl
 import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from square.api_helper import APIHelper
 from square.client import Client
 from dotenv import load_dotenv
 from tqdm import tqdm
 
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，未安装时使用SDK默认的JSON序列化
+    orjson = None
+
 # 加载环境变量
 load_dotenv()
 
+def install_orjson_serializer():
+    """使用orjson序列化Square SDK的请求体，无法处理的对象仍交给SDK原有的序列化方法"""
+    if orjson is None or getattr(APIHelper.json_serialize, 'uses_orjson', False):
+        return
+    
+    default_serialize = APIHelper.json_serialize
+    dumps = orjson.dumps
+    # 允许直接序列化pandas读取产生的NumPy数值，避免退回到较慢的SDK序列化（标准库json也无法处理）
+    options = orjson.OPT_SERIALIZE_NUMPY
+    
+    def json_serialize(obj, should_encode=True):
+        if should_encode and isinstance(obj, (dict, list)):
+            try:
+                return dumps(obj, option=options).decode()
+            except TypeError:
+                # 包含SDK模型等orjson不支持的对象
+                pass
+        return default_serialize(obj, should_encode)
+    
+    json_serialize.uses_orjson = True
+    APIHelper.json_serialize = staticmethod(json_serialize)
+
+install_orjson_serializer()
+
+# 同时进行中的Square API请求数上限，可通过环境变量SQUARE_MAX_CONCURRENCY调整
+try:
+    MAX_CONCURRENT_REQUESTS = int(os.getenv('SQUARE_MAX_CONCURRENCY', ''))
+except ValueError:
+    MAX_CONCURRENT_REQUESTS = 10
+if MAX_CONCURRENT_REQUESTS <= 0:
+    MAX_CONCURRENT_REQUESTS = 10
+# 添加客户到群组时的线程数，略多于请求槽位以便请求完成后立即补位
+ADD_TO_GROUP_WORKERS = MAX_CONCURRENT_REQUESTS + 6
+# 遇到速率限制（429）或临时性服务端错误（5xx）时的最大重试次数、初始等待秒数及随机抖动上限
+RATE_LIMIT_RETRIES = 5
+RATE_LIMIT_BACKOFF = 0.5
+RATE_LIMIT_JITTER = 0.25
+# 可重试的HTTP状态码及Square错误码
+RETRYABLE_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+RETRYABLE_ERROR_CODES = frozenset(('RATE_LIMITED', 'SERVICE_UNAVAILABLE'))
+# 每次批量创建的客户数（Square BulkCreateCustomers上限为100）
+CUSTOMER_BATCH_SIZE = 100
+# 同时提交的批量创建批次数上限
+MAX_CONCURRENT_BATCHES = 4
+# 每周待导入客户达到该数量即提交，使读取文件与导入交替进行且每次提交仍可并发多个批次
+IMPORT_FLUSH_SIZE = CUSTOMER_BATCH_SIZE * MAX_CONCURRENT_BATCHES
+# HTTP连接池大小，需不小于同时进行中的请求数
+HTTP_POOL_CONNECTIONS = 10
+HTTP_POOL_MAXSIZE = max(20, MAX_CONCURRENT_REQUESTS)
+# HTTP层对连接失败的最大重试次数（按状态码的重试由call_api负责）
+HTTP_MAX_RETRIES = 5
+# 分块读取文件时每块的记录数
+READ_CHUNK_SIZE = 50_000
+# 后台读取线程与导入之间最多缓存的客户批次数，每批IMPORT_FLUSH_SIZE条
+READ_QUEUE_SIZE = 4
+# 客户数据文件中需要读取的列
+INPUT_COLUMNS = ('Customer name', 'Customer email', 'Customer phone number', 'Pick-up time (local)')
+# 按文本处理的列，Excel中填成数字的单元格需转为字符串
+TEXT_COLUMNS = ('Customer name', 'Customer email', 'Customer phone number')
+# read_file返回的每条客户数据包含的字段
+CUSTOMER_FIELDS = ('given_name', 'family_name', 'email_address', 'phone_number', 'week_number')
+# 进度条至少间隔多少次更新才重新绘制
+PROGRESS_MIN_ITERS = 50
+
+# 邮箱格式：用户名@域名.后缀，不含空白字符
+_email_pattern = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+def _cell_to_text(value):
+    """将Excel单元格的值转为文本，整数值的数字不带'.0'，空单元格保持None"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
 class SquareCustomerImport:
     def __init__(self, access_token):
         self.client = Client(
             access_token=access_token,
-            environment=os.getenv('SQUARE_ENVIRONMENT', 'sandbox')
+            environment=os.getenv('SQUARE_ENVIRONMENT', 'sandbox'),
+            http_client_instance=self.create_http_session()
         )
+        # 所有线程共享的请求槽位，限制同时进行中的API请求数以遵守速率限制
+        self._request_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+        # 客户群组名称到ID的缓存，首次查找群组时填充
+        self._groups_cache = None
+        # 现有客户的邮箱和手机号，由prefetch_existing_contacts填充，None表示尚未预取
+        self._existing_emails = None
+        self._existing_phones = None
+        # 最近一次read_file中未通过验证而被过滤掉的记录数
+        self._invalid_records = 0
+        # 批量创建客户的幂等性键：每个实例生成一次随机前缀，再加递增序号
+        self._idempotency_prefix = secrets.token_hex(16)
+        self._idempotency_counter = itertools.count(1)
         self.setup_logging()
     
+    def create_http_session(self):
+        """创建带连接池的HTTP会话，供Square客户端在所有请求（包括并发请求）间复用TCP/TLS连接"""
+        session = requests.Session()
+        # 连接层只对连接失败立即重试（如连接池中的连接已被服务端关闭），不等待也不按状态码重试：
+        # 此时仍占用着请求槽位，限流和5xx的退避重试由call_api在释放槽位后进行。
+        # 写操作均带幂等性键，POST重试是安全的
+        retries = Retry(
+            total=HTTP_MAX_RETRIES,
+            status=0,
+            backoff_factor=0,
+            allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_CONNECTIONS,
+            pool_maxsize=HTTP_POOL_MAXSIZE,
+            max_retries=retries
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+    
     def setup_logging(self):
         """设置日志记录"""
         # 确保logs文件夹存在
@@ -41,215 +167,331 @@ class SquareCustomerImport:
         self.logger = logging.getLogger(__name__)
         self.logger.info(f'日志级别设置为: {log_level_name}')
     
-    def format_phone_number(self, phone):
-        """格式化电话号码，仅在国际区号前添加加号"""
-        if not phone:
-            return ""
-        # 将电话号码转换为字符串并去除首尾空白
-        phone = str(phone).strip()
-        # 如果已经包含加号，则直接返回
-        if phone.startswith('+'):
-            return phone
-        # 如果不包含加号，则在开头添加加号
-        return f"+{phone}"
-
-    def process_name(self, name):
-        """处理姓名格式，按照斜线'/'拆分姓和名"""
-        if not name:
-            return {
-                'given_name': '',
-                'family_name': ''
-            }
-        # 如果包含斜线，则按斜线拆分为姓和名
-        if '/' in name:
-            family_name, given_name = name.split('/', 1)
-            return {
-                'given_name': given_name.strip(),
-                'family_name': family_name.strip()
-            }
-        # 如果没有斜线，则将整个名字作为名
-        return {
-            'given_name': name.strip(),
-            'family_name': ''
-        }
+    def call_api(self, api_method, **kwargs):
+        """占用一个请求槽位后调用Square API方法，遇到速率限制或临时性服务端错误时按指数退避重试
+        
+        Args:
+            api_method: Square SDK的API方法
+            **kwargs: 传给API方法的参数
+            
+        Returns:
+            最后一次请求的结果
+        """
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            with self._request_slots:
+                result = api_method(**kwargs)
+            if result.is_success() or attempt == RATE_LIMIT_RETRIES:
+                return result
+            retryable = result.status_code in RETRYABLE_STATUS_CODES or any(
+                error.get('code') in RETRYABLE_ERROR_CODES for error in (result.errors or [])
+            )
+            if not retryable:
+                return result
+            # 在槽位之外等待，让其他请求继续进行；加入随机抖动避免各线程同时重试
+            delay = RATE_LIMIT_BACKOFF * (2 ** attempt) + random.random() * RATE_LIMIT_JITTER
+            self.logger.debug('%s 触发速率限制或服务暂不可用，%.2f秒后重试', api_method.__name__, delay)
+            time.sleep(delay)
+        return result
+
+    def normalize_dataframe(self, df):
+        """按列向量化处理客户数据（姓名拆分、电话格式化、周数计算），并过滤未通过验证的记录
+
+        验证规则：至少有一个必填字段，邮箱为空或格式正确；返回的客户数据无需再逐条验证。
+
+        Args:
+            df: 包含原始客户数据列的DataFrame
+
+        Returns:
+            (通过验证的客户字典列表, 成功解析周数的记录数, 解析失败的记录数, 未通过验证的记录数)
+        """
+        # 只有表头的文件没有任何记录，直接返回
+        if df.empty:
+            return [], 0, 0, 0
+
+        for column in INPUT_COLUMNS:
+            if column not in df:
+                df[column] = pd.NA
+
+        # 按斜线拆分姓和名，没有斜线时整个名字作为名
+        names = df['Customer name'].astype('string').fillna('').str.partition('/')
+        has_slash = names[1].ne('')
+        df['family_name'] = names[0].str.strip().where(has_slash, '')
+        df['given_name'] = names[2].where(has_slash, names[0]).str.strip()
+
+        df['email_address'] = df['Customer email'].astype('string').fillna('').str.strip()
+
+        # 仅在缺少加号的非空号码前添加加号
+        phones = df['Customer phone number'].astype('string').fillna('').str.strip()
+        df['phone_number'] = phones.where(phones.eq('') | phones.str.startswith('+'), '+' + phones)
+
+        # 处理Pick-up time并添加ISO周数（1-53），无法解析的记录周数为0
+        # Excel中的日期单元格已是datetime64列，无需再按格式解析字符串
+        pickup_times = df['Pick-up time (local)']
+        if not pd.api.types.is_datetime64_any_dtype(pickup_times):
+            pickup_times = pd.to_datetime(pickup_times, format='%Y-%m-%d %H:%M:%S', errors='coerce', cache=True)
+        # 在整列datetime64数据上计算周数，保持可空整数类型直到填充0
+        df['week_number'] = pickup_times.dt.isocalendar().week.astype('Int64').fillna(0)
+
+        # 索引在分块读取时保持连续，可直接换算为记录序号；日志级别不输出警告时跳过逐条记录
+        failed_mask = pickup_times.isna()
+        if self.logger.isEnabledFor(logging.WARNING):
+            log_warning = self.logger.warning
+            for index, raw_value in df.loc[failed_mask, 'Pick-up time (local)'].items():
+                if pd.isna(raw_value) or not str(raw_value).strip():
+                    log_warning("记录 %d: 缺少Pick-up time字段或值为空", index + 1)
+                else:
+                    log_warning("记录 %d: 无法解析Pick-up time: '%s'", index + 1, raw_value)
+        failed_week_parse = int(failed_mask.sum())
+
+        # 向量化验证：至少有一个必填字段，邮箱为空或格式正确；电话在上面已统一为空或以加号开头
+        emails = df['email_address']
+        valid = (
+            (df['given_name'].ne('') | df['family_name'].ne('') | emails.ne('') | df['phone_number'].ne(''))
+            & (emails.eq('') | emails.str.match(_email_pattern))
+        )
+        invalid_count = len(df) - int(valid.sum())
+        if invalid_count:
+            if self.logger.isEnabledFor(logging.WARNING):
+                log_warning = self.logger.warning
+                for index in df.index[~valid]:
+                    log_warning("记录 %d: 客户数据验证失败", index + 1)
+            df = df[valid]
+
+        # 只输出处理后的字段，原始列不再随每条记录复制
+        customers = df[list(CUSTOMER_FIELDS)].to_dict(orient='records')
+        return customers, len(valid) - failed_week_parse, failed_week_parse, invalid_count
+
+    def iter_dataframes(self, file_path, file_ext):
+        """按块读取客户数据文件，逐块返回DataFrame
+
+        CSV文件按READ_CHUNK_SIZE分块读取，xlsx文件使用openpyxl只读模式流式读取，
+        两者都只取INPUT_COLUMNS中的列；xls文件一次性读取。
+        """
+        if file_ext == '.csv':
+            # 表头只解析一次，其余列在分词阶段即被丢弃，不会为其创建字符串对象
+            yield from pd.read_csv(
+                file_path,
+                encoding='utf-8',
+                dtype='string',
+                # 只有空单元格视为缺失值，'NA'、'None'、'NULL'等文本按原样保留
+                keep_default_na=False,
+                na_values=[''],
+                usecols=lambda column: column in INPUT_COLUMNS,
+                chunksize=READ_CHUNK_SIZE
+            )
+            return
+
+        if file_ext == '.xlsx':
+            workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                rows = workbook.active.iter_rows(values_only=True)
+                header = next(rows, None)
+                if header is None:
+                    return
+                # 记录所需列在表头中的位置，每行只取这些单元格
+                columns = [column for column in INPUT_COLUMNS if column in header]
+                positions = [header.index(column) for column in columns]
+                # 文本列在取值时即转为字符串，避免数字电话号码因同块中的空单元格变成浮点数并带上'.0'
+                text_flags = [column in TEXT_COLUMNS for column in columns]
+                chunk = []
+                start = 0
+                for row in rows:
+                    values = tuple(
+                        (_cell_to_text(row[i]) if is_text else row[i]) if i < len(row) else None
+                        for i, is_text in zip(positions, text_flags)
+                    )
+                    # 跳过只读模式下可能出现的空行
+                    if all(value is None for value in values):
+                        continue
+                    chunk.append(values)
+                    if len(chunk) >= READ_CHUNK_SIZE:
+                        yield pd.DataFrame(chunk, columns=columns, index=range(start, start + len(chunk)))
+                        start += len(chunk)
+                        chunk = []
+                if chunk:
+                    yield pd.DataFrame(chunk, columns=columns, index=range(start, start + len(chunk)))
+            finally:
+                workbook.close()
+            return
+
+        yield pd.read_excel(
+            file_path,
+            dtype={
+                'Customer name': 'string',
+                'Customer email': 'string',
+                'Customer phone number': 'string'
+            },
+            parse_dates=False
+        )
 
     def read_file(self, file_path):
-        """读取客户数据文件（支持CSV和Excel格式）"""
-        customers = []
+        """读取客户数据文件（支持CSV和Excel格式），逐条返回通过验证的客户数据
+
+        未通过验证的记录数保存在self._invalid_records中。读取出错时记录日志后重新抛出异常，
+        此前已返回的客户数据仍有效，调用方据此判断文件未完整读取。
+        """
         total_records = 0
         success_week_parse = 0
         failed_week_parse = 0
+        self._invalid_records = 0
         try:
             file_ext = os.path.splitext(file_path)[1].lower()
-            self.logger.info(f'开始读取{file_ext}格式文件: {file_path}')
-            
-            if file_ext == '.csv':
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    reader = csv.DictReader(file)
-                    for row_index, row in enumerate(reader, 1):
-                        total_records += 1
-                        # 处理客户姓名
-                        name_parts = self.process_name(str(row.get('Customer name', '')))
-                        row['given_name'] = name_parts['given_name']
-                        row['family_name'] = name_parts['family_name']
-                        
-                        # 处理电话号码
-                        if 'Customer phone number' in row:
-                            row['phone_number'] = self.format_phone_number(row.get('Customer phone number', ''))
-                        
-                        # 处理Pick-up time并添加周数信息
-                        if 'Pick-up time (local)' in row and row['Pick-up time (local)']:
-                            try:
-                                pickup_time_str = str(row['Pick-up time (local)']).strip()
-                                pickup_time = datetime.strptime(pickup_time_str, '%Y-%m-%d %H:%M:%S')
-                                # 获取ISO周数（1-53）
-                                week_number = pickup_time.isocalendar()[1]
-                                row['week_number'] = week_number
-                                success_week_parse += 1
-                                self.logger.debug(f"记录 {row_index}: 成功解析Pick-up time '{pickup_time_str}', 周数={week_number}")
-                            except (ValueError, TypeError) as e:
-                                self.logger.warning(f"记录 {row_index}: 无法解析Pick-up time: '{row.get('Pick-up time (local)', '')}', 错误: {str(e)}")
-                                row['week_number'] = 0
-                                failed_week_parse += 1
-                        else:
-                            self.logger.warning(f"记录 {row_index}: 缺少Pick-up time字段或值为空")
-                            row['week_number'] = 0
-                            failed_week_parse += 1
-                        customers.append(row)
-            elif file_ext in ['.xlsx', '.xls']:
-                df = pd.read_excel(file_path)
-                total_records = len(df)
-                self.logger.info(f'Excel文件共有 {total_records} 条记录')
-                
-                for row_index, row_data in enumerate(df.iterrows(), 1):
-                    _, row = row_data  # pandas返回(index, Series)元组
-                    name_parts = self.process_name(str(row.get('Customer name', '')))
-                    customer = {
-                        'given_name': name_parts['given_name'],
-                        'family_name': name_parts['family_name'],
-                        'email_address': str(row.get('Customer email', '')),
-                        'phone_number': self.format_phone_number(row.get('Customer phone number', ''))
-                    }
-                    
-                    # 处理Pick-up time并添加周数信息
-                    if 'Pick-up time (local)' in row and not pd.isna(row['Pick-up time (local)']):
-                        try:
-                            pickup_time_str = str(row['Pick-up time (local)']).strip()
-                            pickup_time = datetime.strptime(pickup_time_str, '%Y-%m-%d %H:%M:%S')
-                            # 获取ISO周数（1-53）
-                            week_number = pickup_time.isocalendar()[1]
-                            customer['week_number'] = week_number
-                            success_week_parse += 1
-                            self.logger.debug(f"记录 {row_index}: 成功解析Pick-up time '{pickup_time_str}', 周数={week_number}")
-                        except (ValueError, TypeError) as e:
-                            self.logger.warning(f"记录 {row_index}: 无法解析Pick-up time: '{row.get('Pick-up time (local)', '')}', 错误: {str(e)}")
-                            customer['week_number'] = 0
-                            failed_week_parse += 1
-                    else:
-                        self.logger.warning(f"记录 {row_index}: 缺少Pick-up time字段或值为空")
-                        customer['week_number'] = 0
-                        failed_week_parse += 1
-                    
-                    customers.append(customer)
-            else:
+            if file_ext not in ['.csv', '.xlsx', '.xls']:
                 raise ValueError(f'不支持的文件格式: {file_ext}')
-                
-            self.logger.info(f'文件读取完成: 总记录数={total_records}, 成功解析周数={success_week_parse}, 失败={failed_week_parse}')
-            return customers
+            self.logger.info(f'开始读取{file_ext}格式文件: {file_path}')
+
+            for df in self.iter_dataframes(file_path, file_ext):
+                total_records += len(df)
+                customers, success, failed, invalid = self.normalize_dataframe(df)
+                success_week_parse += success
+                failed_week_parse += failed
+                self._invalid_records += invalid
+                yield from customers
+
+            self.logger.info(f'文件读取完成: 总记录数={total_records}, 成功解析周数={success_week_parse}, 失败={failed_week_parse}, 验证失败={self._invalid_records}')
         except Exception as e:
             self.logger.error(f'读取文件失败: {str(e)}')
-            return None
-    
-    def validate_customer_data(self, customer):
-        """验证客户数据的完整性和格式"""
-        # 验证必填字段之一是否存在
-        has_required_field = any([
-            customer.get('given_name'),
-            customer.get('family_name'),
-            customer.get('company_name'),
-            customer.get('email_address'),
-            customer.get('phone_number')
-        ])
-        if not has_required_field:
-            return False
-        
-        # 验证邮箱格式
-        email = customer.get('email_address', '')
-        if email and ('@' not in email or '.' not in email):
-            return False
-        
-        # 验证电话号码格式（可选）
-        phone = customer.get('phone_number', '')
-        if phone and not phone.startswith('+'):
-            return False
-            
-        return True
+            raise
     
-    def check_duplicate_customer(self, email=None, phone=None):
-        """检查是否存在重复的客户"""
-        if not email and not phone:
-            return False
+    def produce_customer_batches(self, file_path, batch_queue, stop_event):
+        """在后台线程中读取文件，按IMPORT_FLUSH_SIZE条一批放入队列，结束时放入None
 
-        query = {
-            'query': {
-                'filter': {
-                    'or': []
-                }
-            }
-        }
-
-        if email:
-            query['query']['filter']['or'].append({
-                'email_address': {'exact': email}
-            })
+        读取出错时先放入已读取的批次，再放入异常对象，由read_file_in_background重新抛出；
+        stop_event被设置后不再放入新的批次，并关闭文件提前结束
+        """
+        customers = self.read_file(file_path)
+        batch = []
+        try:
+            for customer in customers:
+                batch.append(customer)
+                if len(batch) >= IMPORT_FLUSH_SIZE:
+                    if stop_event.is_set():
+                        return
+                    batch_queue.put(batch)
+                    batch = []
+            if batch and not stop_event.is_set():
+                batch_queue.put(batch)
+        except Exception as e:
+            if not stop_event.is_set():
+                if batch:
+                    batch_queue.put(batch)
+                batch_queue.put(e)
+        finally:
+            # 关闭生成器以释放打开的文件（如xlsx工作簿）
+            customers.close()
+            batch_queue.put(None)
 
-        if phone:
-            query['query']['filter']['or'].append({
-                'phone_number': {'exact': phone}
-            })
+    def read_file_in_background(self, file_path):
+        """与read_file相同，逐条返回通过验证的客户数据，但文件解析在后台线程中进行，
+        使解析下一批数据与调用API导入当前批次同时进行；读取出错时在返回已读取的数据后重新抛出异常
+        """
+        batch_queue = queue.Queue(maxsize=READ_QUEUE_SIZE)
+        stop_event = threading.Event()
+        producer = threading.Thread(
+            target=self.produce_customer_batches, args=(file_path, batch_queue, stop_event), daemon=True
+        )
+        producer.start()
+        finished = False
+        try:
+            while True:
+                batch = batch_queue.get()
+                if batch is None:
+                    finished = True
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                yield from batch
+        finally:
+            # 调用方提前停止（导入出错或中途break）时通知后台线程退出，
+            # 并取走队列中剩余的批次，使阻塞在put上的线程能够继续并放入结束标记
+            if not finished:
+                stop_event.set()
+                while batch_queue.get() is not None:
+                    pass
+            producer.join()
 
+    def prefetch_existing_contacts(self):
+        """分页获取Square中所有现有客户的邮箱和手机号，用于本地查重"""
+        self._existing_emails = set()
+        self._existing_phones = set()
         try:
-            result = self.client.customers.search_customers(body=query)
-            if result.is_success() and result.body.get('customers'):
-                return True
-            return False
+            self.logger.info('正在获取现有客户的邮箱和手机号...')
+            cursor = None
+            fetched = 0
+            while True:
+                result = self.call_api(self.client.customers.list_customers, cursor=cursor, limit=100)
+                if not result.is_success():
+                    self.logger.warning(f'获取现有客户失败: {result.errors}')
+                    break
+                
+                for customer in result.body.get('customers', []):
+                    if customer.get('email_address'):
+                        self._existing_emails.add(customer['email_address'])
+                    if customer.get('phone_number'):
+                        self._existing_phones.add(customer['phone_number'])
+                fetched += len(result.body.get('customers', []))
+                
+                cursor = result.body.get('cursor')
+                if not cursor:
+                    break
+            self.logger.info(f'已获取 {fetched} 个现有客户的联系方式')
         except Exception as e:
-            self.logger.warning(f'检查重复客户时发生错误: {str(e)}')
-            return False
+            self.logger.warning(f'获取现有客户时发生错误: {str(e)}')
+
+    def check_duplicate_customer(self, email=None, phone=None):
+        """检查是否存在重复的客户（基于prefetch_existing_contacts预取的联系方式）"""
+        if self._existing_emails is None:
+            self.prefetch_existing_contacts()
+        return bool(
+            (email and email in self._existing_emails)
+            or (phone and phone in self._existing_phones)
+        )
+
+    def remember_contact(self, email=None, phone=None):
+        """将即将创建的客户联系方式加入查重集合，使同一次导入中的后续重复客户被跳过"""
+        if email:
+            self._existing_emails.add(email)
+        if phone:
+            self._existing_phones.add(phone)
+
+    def forget_contact(self, email=None, phone=None):
+        """客户创建失败时将其联系方式移出查重集合"""
+        if email:
+            self._existing_emails.discard(email)
+        if phone:
+            self._existing_phones.discard(phone)
 
     def create_customers_batch(self, customers_data, group_id):
         """批量创建客户"""
+        if self._existing_emails is None:
+            self.prefetch_existing_contacts()
         try:
-            batch_size = 100
+            batch_size = CUSTOMER_BATCH_SIZE
             total_success = 0
             total_failed = 0
+            total_skipped = 0
             all_responses = {}
             
             # 创建总进度条
-            total_pbar = tqdm(total=len(customers_data), desc='总体进度', unit='客户')
+            total_pbar = tqdm(total=len(customers_data), desc='总体进度', unit='客户',
+                              mininterval=0.5, miniters=PROGRESS_MIN_ITERS)
 
+            # 先构建所有批次的请求数据
+            batches = []
             for i in range(0, len(customers_data), batch_size):
                 batch_customers = customers_data[i:i + batch_size]
                 customers_dict = {}
-                
-                # 创建批次进度条
-                batch_pbar = tqdm(total=len(batch_customers), desc=f'第 {i//batch_size + 1} 批', 
-                                 unit='客户', leave=False)
+                duplicate_count = 0
 
                 for customer in batch_customers:
-                    if self.check_duplicate_customer(
-                        email=customer.get('email_address'),
-                        phone=customer.get('phone_number')
-                    ):
-                        self.logger.warning(
-                            f'发现重复客户: {customer.get("email_address")} / {customer.get("phone_number")}'
-                        )
-                        total_failed += 1
-                        total_pbar.update(1)
-                        batch_pbar.update(1)
+                    email = customer.get('email_address')
+                    phone = customer.get('phone_number')
+                    if self.check_duplicate_customer(email=email, phone=phone):
+                        self.logger.warning('发现重复客户: %s / %s', email, phone)
+                        duplicate_count += 1
                         continue
 
-                    customer_id = str(uuid.uuid4())
+                    customer_id = f'{self._idempotency_prefix}-{next(self._idempotency_counter)}'
                     customers_dict[customer_id] = {
                         'given_name': customer.get('given_name'),
                         'family_name': customer.get('family_name', ''),
@@ -258,316 +500,250 @@ class SquareCustomerImport:
                         'phone_number': customer.get('phone_number', ''),
                         'note': customer.get('note', '')
                     }
-                    batch_pbar.update(1)
+                    self.remember_contact(email=email, phone=phone)
                 
-                if not customers_dict:
-                    batch_pbar.close()
-                    continue
+                # 与现有客户（包括组内客户）重复的直接计入跳过数，每批只更新一次进度条
+                if duplicate_count:
+                    total_skipped += duplicate_count
+                    total_pbar.update(duplicate_count)
+                if customers_dict:
+                    batches.append((i//batch_size + 1, customers_dict))
 
-                result = self.client.customers.bulk_create_customers(
-                    body={
-                        'customers': customers_dict
-                    }
-                )
-                
-                if result.is_success():
-                    responses = result.body.get('responses', {})
-                    all_responses.update(responses)
-                    successful_customer_ids = []
-                    for key, response in responses.items():
-                        if 'errors' in response:
-                            self.logger.warning(f'客户 {key} 创建失败: {response["errors"]}')
-                            total_failed += 1
-                        else:
-                            # 先不增加成功计数，等待添加到群组后再确认
-                            successful_customer_ids.append(response['customer']['id'])
-                        total_pbar.update(1)
-                    
-                    # 将成功创建的客户添加到组中
-                    if successful_customer_ids:
-                        self.logger.info(f'尝试将 {len(successful_customer_ids)} 个客户添加到群组...')
-                        if self.add_customers_to_group(group_id, successful_customer_ids):
-                            self.logger.info(f'成功将 {len(successful_customer_ids)} 个客户添加到群组')
-                            total_success += len(successful_customer_ids)
-                        else:
-                            self.logger.error(f'添加 {len(successful_customer_ids)} 个客户到群组失败')
-                            total_failed += len(successful_customer_ids)
-                else:
-                    self.logger.error(f'第 {i//batch_size + 1} 批导入失败: {result.errors}')
-                    total_failed += len(customers_dict)
-                    total_pbar.update(len(customers_dict))
-                
-                batch_pbar.close()
+            # 并发提交各批次，完成一批处理一批
+            with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCHES) as executor:
+                futures = {
+                    executor.submit(
+                        self.call_api,
+                        self.client.customers.bulk_create_customers,
+                        body={'customers': customers_dict}
+                    ): (batch_number, customers_dict)
+                    for batch_number, customers_dict in batches
+                }
+
+                for future in as_completed(futures):
+                    batch_number, customers_dict = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self.logger.error('第 %d 批导入时发生错误: %s', batch_number, e)
+                        for data in customers_dict.values():
+                            self.forget_contact(email=data['email_address'], phone=data['phone_number'])
+                        total_failed += len(customers_dict)
+                        total_pbar.update(len(customers_dict))
+                        continue
+
+                    if result.is_success():
+                        responses = result.body.get('responses', {})
+                        all_responses.update(responses)
+                        successful_customer_ids = []
+                        for key, response in responses.items():
+                            if 'errors' in response:
+                                self.logger.warning('客户 %s 创建失败: %s', key, response['errors'])
+                                data = customers_dict.get(key, {})
+                                self.forget_contact(email=data.get('email_address'), phone=data.get('phone_number'))
+                                total_failed += 1
+                            else:
+                                # 先不增加成功计数，等待添加到群组后再确认
+                                successful_customer_ids.append(response['customer']['id'])
+                        total_pbar.update(len(responses))
+                        
+                        # 将成功创建的客户添加到组中。BulkCreateCustomers的请求体不支持group_ids
+                        # （Customer.group_ids为只读字段），因此只能在创建后逐个调用AddGroupToCustomer
+                        if successful_customer_ids:
+                            self.logger.info(f'尝试将 {len(successful_customer_ids)} 个客户添加到群组...')
+                            if self.add_customers_to_group(group_id, successful_customer_ids):
+                                self.logger.info(f'成功将 {len(successful_customer_ids)} 个客户添加到群组')
+                                total_success += len(successful_customer_ids)
+                            else:
+                                self.logger.error(f'添加 {len(successful_customer_ids)} 个客户到群组失败')
+                                total_failed += len(successful_customer_ids)
+                    else:
+                        self.logger.error('第 %d 批导入失败: %s', batch_number, result.errors)
+                        for data in customers_dict.values():
+                            self.forget_contact(email=data['email_address'], phone=data['phone_number'])
+                        total_failed += len(customers_dict)
+                        total_pbar.update(len(customers_dict))
             
             total_pbar.close()
-            self.logger.info(f'导入完成: 成功 {total_success} 个, 失败 {total_failed} 个')
-            return True, {'responses': all_responses}
+            self.logger.info(f'导入完成: 成功 {total_success} 个, 失败 {total_failed} 个, 跳过重复 {total_skipped} 个')
+            return True, {
+                'responses': all_responses,
+                'success': total_success,
+                'failed': total_failed,
+                'skipped': total_skipped
+            }
         except Exception as e:
             self.logger.error(f'批量创建客户失败: {str(e)}')
             return False, str(e)
 
-    def check_duplicate_in_group(self, phone_number, group_customers):
-        """检查手机号在同一周客户组内是否重复
+    def prepare_week_group(self, week_number):
+        """为指定周数创建（或查找）客户组
+        
+        组内已有客户的手机号已包含在预取的现有客户联系方式中，由check_duplicate_customer统一查重，
+        无需再分页获取组内客户
         
         Args:
-            phone_number: 要检查的手机号
-            group_customers: 同一周的客户列表
+            week_number: ISO周数，0表示未知周数
             
         Returns:
-            如果手机号在组内重复返回True，否则返回False
+            包含群组信息、待导入客户和统计数据的字典，群组创建失败时group_id为None
         """
-        if not phone_number or not group_customers:
-            return False
+        if week_number == 0:
+            group_name = "未知周数_客户组"
+        else:
+            current_year = datetime.now().year
+            group_name = f"{current_year}年第{week_number}周_客户组"
         
-        self.logger.debug(f'检查手机号 {phone_number} 是否在组内重复')
-            
-        # 遍历组内所有客户，检查手机号是否重复
-        for customer in group_customers:
-            customer_phone = customer.get('phone_number')
-            if customer_phone and customer_phone == phone_number:
-                self.logger.debug(f'发现重复手机号: {phone_number}')
-                return True
-        return False
-    
-    def get_customers_in_group(self, group_id):
-        """获取客户组内的所有客户
+        week = {
+            'group_name': group_name,
+            'group_id': None,
+            'customers': [],
+            'total': 0,
+            'success': 0,
+            'failed': 0,
+            'skipped': 0
+        }
         
-        Args:
-            group_id: 客户组ID
-            
-        Returns:
-            客户组内的客户列表，如果出错则返回空列表
-        """
-        try:
-            self.logger.info(f'正在获取客户组 {group_id} 内的客户...')
-            all_customers = []
-            cursor = None
-            page_limit = 100  # Square API限制每页最多100条记录
-            
-            # 使用分页查询获取所有客户
-            while True:
-                # 构建查询
-                query = {
-                    'query': {
-                        'filter': {
-                            'group_ids': {'any': [group_id]}
-                        }
-                    },
-                    'limit': page_limit
-                }
-                
-                # 添加游标用于分页
-                if cursor:
-                    query['cursor'] = cursor
-                
-                result = self.client.customers.search_customers(body=query)
-                
-                if result.is_success():
-                    page_customers = result.body.get('customers', [])
-                    all_customers.extend(page_customers)
-                    self.logger.info(f'已获取 {len(all_customers)} 个客户')
-                    
-                    # 检查是否有更多页
-                    cursor = result.body.get('cursor')
-                    if not cursor:
-                        break
-                else:
-                    self.logger.error(f'获取客户组内客户失败: {result.errors}')
-                    return []
-            
-            self.logger.info(f'成功获取客户组内的 {len(all_customers)} 个客户')
-            return all_customers
-        except Exception as e:
-            self.logger.error(f'获取客户组内客户时发生错误: {str(e)}')
-            return []
-    
-    def import_customers(self, file_path):
-        """导入客户数据的主要流程"""
-        customers = self.read_file(file_path)
-        if not customers:
-            self.logger.error('没有找到客户数据')
+        self.logger.info(f'为第{week_number}周客户准备群组 {group_name}...')
+        group_id = self.create_customer_group(group_name)
+        if not group_id:
+            self.logger.error(f'创建{group_name}客户群组失败，跳过该批次')
+            return week
+        week['group_id'] = group_id
+        return week
+
+    def flush_week_customers(self, week):
+        """将某周已去重、待导入的客户提交到对应的客户组，并清空待导入列表"""
+        week_customers = week['customers']
+        if not week_customers:
             return
+        week['customers'] = []
+        group_name = week['group_name']
         
-        total = len(customers)
+        self.logger.info(f'开始批量导入{group_name}的{len(week_customers)}个客户...')
+        is_success, result = self.create_customers_batch(week_customers, week['group_id'])
+        
+        if is_success:
+            # 与现有客户重复的计入跳过数，创建失败的客户计入失败数
+            week['success'] += result['success']
+            week['failed'] += result['failed']
+            week['skipped'] += result['skipped']
+            self.logger.info(f'{group_name}客户批量导入完成')
+        else:
+            week['failed'] += len(week_customers)
+            self.logger.error(f'{group_name}客户批量导入失败: {result}')
+
+    def import_customers(self, file_path):
+        """导入客户数据的主要流程"""
+        total = 0
         success = 0
-        failed = 0
-        valid_customers = []
+        # 文件内已出现过的邮箱和手机号，用于在调用API之前剔除重复行
+        seen_emails = set()
+        seen_phones = set()
+        file_duplicates = 0
+        # 按周数分组的客户组信息、待导入的客户及统计数据
+        weeks = {}
+        # 文件读取中途出错时为True，此前读取的客户仍会导入，但整体导入不完整
+        read_failed = False
         
-        self.logger.info(f'开始验证{total}个客户数据...')
+        # 一次性预取现有客户的联系方式，避免逐个客户查询
+        self.prefetch_existing_contacts()
         
-        # 创建验证进度条
-        validate_pbar = tqdm(total=total, desc='验证进度', unit='客户')
+        self.logger.info('开始读取、验证并导入客户数据...')
         
-        # 验证所有客户数据
-        for customer in customers:
-            if not self.validate_customer_data(customer):
-                self.logger.warning(f'客户数据验证失败: {customer}')
-                failed += 1
-            else:
-                valid_customers.append(customer)
-                success += 1
-            validate_pbar.update(1)
-            validate_pbar.set_postfix({'成功': success, '失败': failed})
+        # 创建验证进度条，文件按块读取因此总数未知
+        validate_pbar = tqdm(desc='验证进度', unit='客户', mininterval=0.5, miniters=PROGRESS_MIN_ITERS)
         
-        validate_pbar.close()
-        
-        if valid_customers:
-            # 按周数对客户进行分组
-            customers_by_week = {}
-            week_stats = {}
+        # 读取时已完成向量化验证，单次遍历完成文件内查重和按周分组，每周待导入客户攒满一批即提交；
+        # 文件在后台线程中解析，提交导入期间下一批数据已在准备
+        # 读取出错时read_file_in_background在返回已读取的数据后抛出异常，只捕获读取本身的异常
+        customers = self.read_file_in_background(file_path)
+        while True:
+            try:
+                customer = next(customers, None)
+            except Exception:
+                # read_file已记录具体错误
+                read_failed = True
+                break
+            if customer is None:
+                break
+            total += 1
+            validate_pbar.update(1)
             
-            self.logger.info('开始按周数分组客户数据...')
-            for customer in valid_customers:
-                week_number = customer.get('week_number', 0)
-                if week_number not in customers_by_week:
-                    customers_by_week[week_number] = []
-                    week_stats[week_number] = {'total': 0, 'valid_week': 0, 'invalid_week': 0}
-                
-                customers_by_week[week_number].append(customer)
-                week_stats[week_number]['total'] += 1
-                
-                if week_number > 0:
-                    week_stats[week_number]['valid_week'] += 1
-                else:
-                    week_stats[week_number]['invalid_week'] += 1
+            # 文件内重复的客户直接跳过，不产生任何API调用
+            email = customer.get('email_address')
+            phone_number = customer.get('phone_number')
+            if (email and email in seen_emails) or (phone_number and phone_number in seen_phones):
+                file_duplicates += 1
+                continue
+            if email:
+                seen_emails.add(email)
+            if phone_number:
+                seen_phones.add(phone_number)
+            success += 1
             
-            # 输出每个周的统计信息
-            for week_number, stats in week_stats.items():
-                if week_number == 0:
-                    week_name = "未知周数"
-                else:
-                    week_name = f"第{week_number}周"
-                    
-                self.logger.info(f'{week_name}客户统计: 总数={stats["total"]}, 有效周数={stats["valid_week"]}, 无效周数={stats["invalid_week"]}')
+            week_number = customer.get('week_number', 0)
+            week = weeks.get(week_number)
+            if week is None:
+                week = weeks[week_number] = self.prepare_week_group(week_number)
+            week['total'] += 1
             
-            total_success = 0
-            total_failed = 0
+            if not week['group_id']:
+                week['failed'] += 1
+                continue
             
-            # 为每个周创建一个客户组并导入客户
-            for week_number, week_customers in customers_by_week.items():
-                if week_number == 0:
-                    group_name = "未知周数_客户组"
-                else:
-                    current_year = datetime.now().year
-                    group_name = f"{current_year}年第{week_number}周_客户组"
-                
-                self.logger.info(f'为{group_name}的{len(week_customers)}个客户创建群组...')
-                group_id = self.create_customer_group(group_name)
-                
-                if not group_id:
-                    self.logger.error(f'创建{group_name}客户群组失败，跳过该批次')
-                    total_failed += len(week_customers)
-                    continue
-                
-                # 获取组内现有客户，用于手机号查重
-                existing_customers = self.get_customers_in_group(group_id)
-                self.logger.info(f'获取到{group_name}客户组内现有客户 {len(existing_customers)} 个')
-                
-                # 在同一周内进行手机号查重
-                deduplicated_customers = []
-                duplicate_count = 0
-                processed_phones = set()
-                
-                # 将现有客户的手机号添加到已处理集合中
-                for existing_customer in existing_customers:
-                    phone = existing_customer.get('phone_number')
-                    if phone:
-                        processed_phones.add(phone)
-                        self.logger.debug(f'添加现有客户手机号到查重集合: {phone}')
-                
-                for customer in week_customers:
-                    phone_number = customer.get('phone_number')
-                    if phone_number and phone_number in processed_phones:
-                        self.logger.warning(f'在{group_name}内发现重复手机号: {phone_number}，跳过该客户')
-                        duplicate_count += 1
-                        continue
-                    
-                    if phone_number:
-                        processed_phones.add(phone_number)
-                    deduplicated_customers.append(customer)
-                
-                if duplicate_count > 0:
-                    self.logger.info(f'{group_name}内检测到{duplicate_count}个重复手机号客户，已跳过')
-                
-                self.logger.info(f'开始批量导入{group_name}的{len(deduplicated_customers)}个客户...')
-                is_success, result = self.create_customers_batch(deduplicated_customers, group_id)
-                
-                if is_success:
-                    total_success += len(deduplicated_customers)
-                    self.logger.info(f'{group_name}客户批量导入成功')
-                else:
-                    total_failed += len(deduplicated_customers)
-                    self.logger.error(f'{group_name}客户批量导入失败: {result}')
+            week['customers'].append(customer)
             
-            success = total_success
-            failed = total_failed
+            if len(week['customers']) >= IMPORT_FLUSH_SIZE:
+                self.flush_week_customers(week)
+        
+        # 未通过验证的记录在读取时已被过滤，这里补回统计
+        failed = self._invalid_records
+        total += failed
+        validate_pbar.set_postfix({'成功': success, '失败': failed, '重复': file_duplicates})
+        validate_pbar.close()
+        
+        if file_duplicates:
+            self.logger.info(f'文件内发现 {file_duplicates} 条重复客户（邮箱或手机号相同），已跳过')
+        
+        # 文件内重复的客户没有对应到某一周，计入总的跳过数
+        skipped = file_duplicates
+        
+        if not total:
+            if not read_failed:
+                self.logger.error('没有找到客户数据')
+            return
+        
+        if weeks:
+            # 提交各周剩余的待导入客户
+            for week in weeks.values():
+                self.flush_week_customers(week)
+            
+            success = sum(week['success'] for week in weeks.values())
+            failed = sum(week['failed'] for week in weeks.values())
+            skipped += sum(week['skipped'] for week in weeks.values())
             
             # 添加每周导入数据的详细统计
             self.logger.info('='*50)
             self.logger.info('每周导入数据统计汇总:')
             self.logger.info('-'*50)
             
-            # 创建每周统计数据字典
-            week_import_stats = {}
-            for week_number in customers_by_week.keys():
-                week_import_stats[week_number] = {
-                    'total': len(customers_by_week[week_number]),
-                    'success': 0,
-                    'skipped': 0
-                }
-            
-            # 遍历每个周的统计信息
-            for week_number, stats in sorted(week_import_stats.items()):
+            for week_number, week in sorted(weeks.items()):
                 if week_number == 0:
                     week_name = "未知周数"
                 else:
                     week_name = f"第{week_number}周"
                 
-                # 计算成功和跳过的数量
-                total_in_week = stats['total']
-                skipped_in_week = 0
-                
-                # 获取该周的客户组名称
-                if week_number == 0:
-                    group_name = "未知周数_客户组"
-                else:
-                    current_year = datetime.now().year
-                    group_name = f"{current_year}年第{week_number}周_客户组"
-                
-                # 查找该周的重复数据数量
-                for week_num, week_customers in customers_by_week.items():
-                    if week_num == week_number:
-                        # 计算该周内被跳过的重复客户数量
-                        original_count = len(week_customers)
-                        # 获取该周的去重后客户数量
-                        deduplicated_count = 0
-                        processed_phones = set()
-                        
-                        # 模拟去重过程来计算跳过的数量
-                        for customer in week_customers:
-                            phone_number = customer.get('phone_number')
-                            if phone_number and phone_number in processed_phones:
-                                skipped_in_week += 1
-                            else:
-                                if phone_number:
-                                    processed_phones.add(phone_number)
-                                deduplicated_count += 1
-                
-                # 计算成功导入的数量
-                success_in_week = total_in_week - skipped_in_week
-                
-                # 更新统计信息
-                week_import_stats[week_number]['success'] = success_in_week
-                week_import_stats[week_number]['skipped'] = skipped_in_week
-                
-                # 输出该周的统计信息
-                self.logger.info(f'{week_name}客户导入统计: 总数={total_in_week}, 成功导入={success_in_week}, 跳过重复={skipped_in_week}')
+                self.logger.info(f'{week_name}客户导入统计: 总数={week["total"]}, 成功导入={week["success"]}, 跳过重复={week["skipped"]}')
             
             self.logger.info('-'*50)
-            self.logger.info(f'总计: 成功导入 {success} 个, 失败 {failed} 个')
+            self.logger.info(f'总计: 成功导入 {success} 个, 失败 {failed} 个, 跳过重复 {skipped} 个（其中文件内重复 {file_duplicates} 个）')
             self.logger.info('='*50)
         
-        self.logger.info(f'导入完成: 成功 {success} 个, 失败 {failed} 个')
+        if read_failed:
+            self.logger.error(f'文件读取中途出错，导入未完成: 仅处理了前 {total} 条记录，成功 {success} 个, 失败 {failed} 个, 跳过重复 {skipped} 个')
+        else:
+            self.logger.info(f'导入完成: 成功 {success} 个, 失败 {failed} 个, 跳过重复 {skipped} 个')
 
     def create_customer_group(self, group_name):
         """创建客户群组
@@ -585,10 +761,11 @@ class SquareCustomerImport:
                 self.logger.info(f'找到已存在的客户群组: {group_name} (ID: {existing_group_id})')
                 return existing_group_id
             
-            # 使用群组名称作为幂等性键的一部分，确保相同名称的群组不会重复创建
-            idempotency_key = f"{group_name}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            # 同名群组已由上面的查找排除，幂等性键只需保证本次请求（含重试）唯一
+            idempotency_key = secrets.token_hex(16)
             
-            result = self.client.customer_groups.create_customer_group(
+            result = self.call_api(
+                self.client.customer_groups.create_customer_group,
                 body={
                     'idempotency_key': idempotency_key,
                     'group': {
@@ -600,6 +777,8 @@ class SquareCustomerImport:
             if result.is_success():
                 group_id = result.body.get('group', {}).get('id')
                 self.logger.info(f'成功创建客户群组: {group_name} (ID: {group_id})')
+                if self._groups_cache is not None:
+                    self._groups_cache[group_name] = group_id
                 return group_id
             else:
                 # 根据API文档，处理2022-03-16版本后的错误响应
@@ -623,18 +802,42 @@ class SquareCustomerImport:
             找到返回群组ID，未找到返回None
         """
         try:
-            result = self.client.customer_groups.list_customer_groups()
-            
-            if result.is_success():
-                groups = result.body.get('groups', [])
-                for group in groups:
-                    if group.get('name') == group_name:
-                        return group.get('id')
-            return None
+            # 首次查找时获取全部群组并缓存，之后直接查缓存
+            if self._groups_cache is None:
+                groups_cache = {}
+                cursor = None
+                while True:
+                    result = self.call_api(self.client.customer_groups.list_customer_groups, cursor=cursor)
+                    if not result.is_success():
+                        self.logger.warning(f'获取客户群组列表失败: {result.errors}')
+                        return None
+                    for group in result.body.get('groups', []):
+                        groups_cache.setdefault(group.get('name'), group.get('id'))
+                    cursor = result.body.get('cursor')
+                    if not cursor:
+                        break
+                self._groups_cache = groups_cache
+            return self._groups_cache.get(group_name)
         except Exception as e:
             self.logger.warning(f'查找客户群组时发生错误: {str(e)}')
             return None
 
+    def add_customer_to_group(self, customer_id, group_id):
+        """将单个客户添加到群组，速率限制的重试由call_api处理
+        
+        Args:
+            customer_id: 客户ID
+            group_id: 群组ID
+            
+        Returns:
+            最后一次请求的结果
+        """
+        return self.call_api(
+            self.client.customers.add_group_to_customer,
+            customer_id=customer_id,
+            group_id=group_id
+        )
+
     def add_customers_to_group(self, group_id, customer_ids):
         """将客户添加到群组
         
@@ -650,53 +853,55 @@ class SquareCustomerImport:
             return False
             
         try:
-            # 分批处理客户，避免单次请求数据过大
-            batch_size = 100
             success = True
             total_added = 0
             total_failed = 0
             
-            # 创建总进度条
-            total_pbar = tqdm(total=len(customer_ids), desc='添加客户到群组', unit='客户')
+            # 创建进度条
+            total_pbar = tqdm(total=len(customer_ids), desc='添加客户到群组', unit='客户',
+                              mininterval=0.5, miniters=PROGRESS_MIN_ITERS)
             
-            for i in range(0, len(customer_ids), batch_size):
-                batch_customer_ids = customer_ids[i:i + batch_size]
-                # 创建批次进度条
-                batch_pbar = tqdm(total=len(batch_customer_ids), desc=f'第 {i//batch_size + 1} 批', 
-                                 unit='客户', leave=False)
+            # 调用方每次传入的是一个批量创建批次中成功的客户（不超过CUSTOMER_BATCH_SIZE个），
+            # 因此可一次性全部提交，待完成的任务数有上限；同时进行中的请求数由共享的请求槽位限制
+            with ThreadPoolExecutor(max_workers=ADD_TO_GROUP_WORKERS) as executor:
+                futures = {
+                    executor.submit(self.add_customer_to_group, customer_id, group_id): customer_id
+                    for customer_id in customer_ids
+                }
                 
-                for customer_id in batch_customer_ids:
-                    result = self.client.customers.add_group_to_customer(
-                        customer_id=customer_id,
-                        group_id=group_id
-                    )
-                    
-                    if not result.is_success():
-                        errors = result.errors
-                        error_details = []
-                        for error in errors:
-                            if error.get('code') == 'NOT_FOUND':
-                                error_details.append('群组或客户不存在')
-                            elif error.get('code') == 'INVALID_REQUEST':
-                                error_details.append('请求格式无效')
-                            else:
-                                error_details.append(str(error))
-                        
-                        self.logger.error(f'添加客户 {customer_id} 到群组失败: {", ".join(error_details)}')
+                for completed, future in enumerate(as_completed(futures), 1):
+                    customer_id = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self.logger.error('添加客户 %s 到群组时发生错误: %s', customer_id, e)
                         total_failed += 1
                         success = False
                     else:
-                        total_added += 1
+                        if not result.is_success():
+                            errors = result.errors
+                            error_details = []
+                            for error in errors:
+                                if error.get('code') == 'NOT_FOUND':
+                                    error_details.append('群组或客户不存在')
+                                elif error.get('code') == 'INVALID_REQUEST':
+                                    error_details.append('请求格式无效')
+                                else:
+                                    error_details.append(str(error))
+                            
+                            self.logger.error('添加客户 %s 到群组失败: %s', customer_id, ', '.join(error_details))
+                            total_failed += 1
+                            success = False
+                        else:
+                            total_added += 1
                     
-                    # 更新两个进度条
-                    batch_pbar.update(1)
+                    # 刷新频率由tqdm自行控制
                     total_pbar.update(1)
-                    # 更新进度条显示的成功/失败数量
-                    batch_pbar.set_postfix({'成功': total_added, '失败': total_failed})
-                    total_pbar.set_postfix({'成功': total_added, '失败': total_failed})
-                
-                batch_pbar.close()
+                    # 每完成一定数量后更新一次进度条显示的成功/失败数量
+                    if completed % PROGRESS_MIN_ITERS == 0:
+                        total_pbar.set_postfix({'成功': total_added, '失败': total_failed}, refresh=False)
             
+            total_pbar.set_postfix({'成功': total_added, '失败': total_failed})
             total_pbar.close()
             self.logger.info(f'添加客户到群组完成: 成功 {total_added} 个, 失败 {total_failed} 个')
             return success